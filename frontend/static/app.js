@@ -86,8 +86,11 @@ class WebSocketManager {
 
 		this.ws.addEventListener("message", (e) => {
 			try {
-				const { text } = JSON.parse(e.data);
-				appendMessage(text);
+				// Messages arriving close together are coalesced into one array frame.
+				const data = JSON.parse(e.data);
+				for (const { text } of Array.isArray(data) ? data : [data]) {
+					appendMessage(text);
+				}
 			} catch {
 				appendMessage(e.data);
 			}
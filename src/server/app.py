@@ -1,25 +1,34 @@
 import argparse
+import asyncio
+import contextlib
+import gzip
 import logging
-import multiprocessing
 import os
 import signal
+import socket
 import sys
+import time
 from pathlib import Path
 from types import FrameType
 
 from aiohttp import web
 
 from server.metrics import get_metrics_output
-from server.models import json_dumps
+from server.models import dumps_bytes
 from server.redis import RedisManager, install_redis_manager
 from server.ws import WSMessageRouter, install_ws_router
 
+if sys.platform != "win32":
+    # uvloop is not available on Windows, which keeps the default event loop.
+    import uvloop
+
 logger = logging.getLogger(__name__)
 
 
 STATIC_RESOURCES_DIR = Path(__file__).resolve().parent.parent / "static"
 MINUTES_IN_HOUR = 60
 HOUR_IN_DAY = 24
+INDEX_CACHE_CONTROL = "public, max-age=300"
 
 
 async def on_startup(app: web.Application) -> None:
@@ -56,8 +65,53 @@ async def metrics(_: web.Request) -> web.Response:
     )
 
 
-async def index(_: web.Request) -> web.FileResponse:
-    return web.FileResponse(STATIC_RESOURCES_DIR / "index.html")
+def load_index_page() -> tuple[bytes, bytes]:
+    """Read index.html once and pre-compress it, returning (raw, gzipped)."""
+    body = (STATIC_RESOURCES_DIR / "index.html").read_bytes()
+    return body, gzip.compress(body, compresslevel=9)
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Check whether an Accept-Encoding header allows a gzip response.
+
+    Codings are matched whole and their q-values honored, so `gzip;q=0`
+    refuses gzip and a bare `*` accepts it (RFC 9110, section 12.5.3).
+    """
+    gzip_q: float | None = None
+    wildcard_q: float | None = None
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+
+        name = name.strip().lower()
+        if name in ("gzip", "x-gzip"):
+            gzip_q = q
+        elif name == "*":
+            wildcard_q = q
+
+    if gzip_q is not None:
+        return gzip_q > 0
+    return wildcard_q is not None and wildcard_q > 0
+
+
+async def index(req: web.Request) -> web.Response:
+    body, gzipped_body = req.app["index_page"]
+    # Caches must key the response on Accept-Encoding, gzipped or not.
+    headers = {"Cache-Control": INDEX_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if accepts_gzip(req.headers.get("Accept-Encoding", "")):
+        body = gzipped_body
+        headers["Content-Encoding"] = "gzip"
+
+    return web.Response(
+        body=body, content_type="text/html", charset="utf-8", headers=headers
+    )
 
 
 async def get_messages(req: web.Request) -> web.Response:
@@ -73,7 +127,10 @@ async def get_messages(req: web.Request) -> web.Response:
     redis_manager: RedisManager = req.app["redis_manager"]
     try:
         messages = await redis_manager.fetch_history(minutes=minutes)
-        return web.json_response({"messages": messages}, dumps=json_dumps)
+        # Serialize straight to bytes; no intermediate str for aiohttp to re-encode.
+        return web.Response(
+            body=dumps_bytes({"messages": messages}), content_type="application/json"
+        )
     except Exception as exc:
         logger.exception("Failed to fetch message history")
         return web.json_response({"error": str(exc)}, status=500)
@@ -91,6 +148,8 @@ def create_app(redis_url: str) -> web.Application:
         ]
     )
 
+    app["index_page"] = load_index_page()
+
     redis_manager = install_redis_manager(app, redis_url)
     install_ws_router(app, redis_manager)
 
@@ -100,56 +159,129 @@ def create_app(redis_url: str) -> web.Application:
     return app
 
 
-def run_worker(worker_id: int, host: str, port: int, redis_url: str) -> None:
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    """Create the server's event loop on uvloop's libuv-based implementation.
+
+    Socket reads and writes, the timer heap behind send timeouts, and the task
+    scheduling behind gather all run in C on uvloop. Windows falls back to
+    asyncio's default loop.
+    """
+    if sys.platform == "win32":
+        return asyncio.new_event_loop()
+    return uvloop.new_event_loop()
+
+
+def bind_listening_sockets(host: str, port: int) -> list[socket.socket]:
+    """Bind the listening sockets once in the parent so all workers share them.
+
+    Workers accepting from shared sockets are balanced by the kernel's accept
+    queue, unlike SO_REUSEPORT hashing which can pile long-lived WebSocket
+    connections onto a few workers. Like web.run_app, the host is resolved
+    and every address it maps to is bound, so `localhost` listens on both
+    IPv4 and IPv6.
+    """
+    # The resolver can list an address more than once; keep the first of each.
+    addresses = dict.fromkeys(
+        (family, sockaddr)
+        for family, _, _, _, sockaddr in socket.getaddrinfo(
+            host or None, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE
+        )
+    )
+    socks: list[socket.socket] = []
+    try:
+        for family, sockaddr in addresses:
+            # IPv6 sockets are bound V6ONLY, so they don't clash with IPv4 ones.
+            sock = socket.create_server(sockaddr, family=family)
+            sock.set_inheritable(True)
+            socks.append(sock)
+    except BaseException:
+        for sock in socks:
+            sock.close()
+        raise
+    return socks
+
+
+def run_worker(worker_id: int, socks: list[socket.socket], redis_url: str) -> None:
     setup_logging()
 
-    logger.info(f"[Worker {worker_id}] Starting on {host}:{port} (PID: {os.getpid()})")
+    addresses = ", ".join("{}:{}".format(*sock.getsockname()[:2]) for sock in socks)
+    logger.info(f"[Worker {worker_id}] Starting on {addresses} (PID: {os.getpid()})")
 
     app = create_app(redis_url)
 
     web.run_app(
         app,
-        host=host,
-        port=port,
-        reuse_port=True,
+        sock=socks,
+        loop=new_event_loop(),
         print=lambda *args: None,  # Suppress aiohttp's startup message per worker
     )
 
 
-def shutdown_workers(
-    processes: list[multiprocessing.Process], timeout: int = 5
-) -> None:
-    logger.info("Shutting down %d workers...", len(processes))
+def reap_worker(pid: int) -> bool:
+    """Collect an exited worker without blocking, returning True once it is gone."""
+    try:
+        reaped_pid, _ = os.waitpid(pid, os.WNOHANG)
+    except ChildProcessError:
+        return True
+    return reaped_pid == pid
 
-    for process in processes:
-        if process.is_alive():
-            process.terminate()
 
-    for process in processes:
-        process.join(timeout=timeout)
+def shutdown_workers(pids: list[int], timeout: int = 5) -> None:
+    logger.info("Shutting down %d workers...", len(pids))
 
-        if process.is_alive():
-            logger.warning(
-                "Worker %s didn't stop after %d seconds, killing...",
-                timeout,
-                process.name,
-            )
-            process.kill()
-            process.join()
+    for pid in pids:
+        with contextlib.suppress(ProcessLookupError):
+            os.kill(pid, signal.SIGTERM)
 
-    logger.info("All %d workers stopped", len(processes))
+    deadline = time.monotonic() + timeout
+    remaining = list(pids)
+    while remaining and time.monotonic() < deadline:
+        remaining = [pid for pid in remaining if not reap_worker(pid)]
+        if remaining:
+            time.sleep(0.05)
 
+    for pid in remaining:
+        logger.warning(
+            "Worker %d didn't stop after %d seconds, killing...", pid, timeout
+        )
+        with contextlib.suppress(ProcessLookupError):
+            os.kill(pid, signal.SIGKILL)
+        with contextlib.suppress(ChildProcessError):
+            os.waitpid(pid, 0)
 
-def register_signal_handlers(processes: list[multiprocessing.Process]) -> None:
+    logger.info("All %d workers stopped", len(pids))
+
+
+def register_signal_handlers(pids: list[int]) -> None:
     def signal_handler(signum: int, _: FrameType | None) -> None:
         logger.info("Received signal %d", signum)
-        shutdown_workers(processes)
+        shutdown_workers(pids)
         sys.exit(0)
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
 
+def fork_worker(worker_id: int, socks: list[socket.socket], redis_url: str) -> int:
+    """Fork a worker that shares the parent's imported modules copy-on-write.
+
+    Returns the child's PID in the parent; the child never returns.
+    """
+    pid = os.fork()
+    if pid != 0:
+        return pid
+
+    exit_code = 0
+    try:
+        run_worker(worker_id, socks, redis_url)
+    except Exception:
+        logger.exception("[Worker %d] Exited with an error", worker_id)
+        exit_code = 1
+    finally:
+        # Skip the parent's atexit handlers and buffered state in the child.
+        os._exit(exit_code)
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="A multiuser webchat application")
 
@@ -209,28 +341,28 @@ def main() -> None:
 
     if workers == 1:
         logger.info("Starting server with address %s:%s...", host, port)
-        web.run_app(create_app(redis_url), host=host, port=port)
+        web.run_app(create_app(redis_url), host=host, port=port, loop=new_event_loop())
         return
 
-    processes: list[multiprocessing.Process] = []
+    socks = bind_listening_sockets(host, port)
+    logger.info("Listening on %s:%s with %d workers...", host, port, workers)
+
+    pids: list[int] = []
     for worker_id in range(workers):
-        process = multiprocessing.Process(
-            target=run_worker,
-            args=(worker_id, host, port, redis_url),
-            name=f"worker-{worker_id}",
-        )
-        process.start()
-        logger.info("Started worker %d (PID: %d)", worker_id, process.pid)
+        pid = fork_worker(worker_id, socks, redis_url)
+        logger.info("Started worker %d (PID: %d)", worker_id, pid)
 
-        processes.append(process)
+        pids.append(pid)
 
-    register_signal_handlers(processes)
+    # Only live workers stay in `pids`, so the signal handler never signals a
+    # reaped worker whose PID the OS may have handed to another process.
+    register_signal_handlers(pids)
 
     try:
-        for process in processes:
-            process.join()
-
-        shutdown_workers(processes)
+        while pids:
+            with contextlib.suppress(ChildProcessError):
+                os.waitpid(pids[0], 0)
+            pids.pop(0)
     except KeyboardInterrupt:
         # Signal handler is already called at this point.
         pass
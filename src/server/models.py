@@ -1,34 +1,46 @@
-import json
 import logging
-from dataclasses import asdict, dataclass
+from dataclasses import dataclass
 from typing import Any
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
+CHAT_MESSAGE_FIELDS = ("text", "type", "ts")
+
 
-@dataclass(frozen=True, kw_only=True)
+@dataclass(frozen=True, slots=True, kw_only=True)
 class ChatMessage:
     text: str
     type: str
     ts: int
 
+    def to_json(self) -> bytes:
+        return orjson.dumps(self)
 
-class ChatMessageEncoder(json.JSONEncoder):
-    def default(self, o: Any) -> Any:
-        if isinstance(o, ChatMessage):
-            return asdict(o)
-        return super().default(o)
 
+def chat_message_from_bytes(s: str | bytes) -> ChatMessage:
+    """Decode a payload that is known to hold exactly one ChatMessage.
 
-def chat_message_decoder(obj: dict[str, Any]) -> ChatMessage | dict[str, Any]:
-    if {"text", "type", "ts"}.issubset(obj.keys()):
-        return ChatMessage(**obj)
-    return obj
+    The fields are read straight out of the orjson result. Raises ValueError if the payload is not a valid chat message,
+    including when a field has the wrong JSON type or unknown fields are set.
+    """
+    obj = orjson.loads(s)
+    try:
+        text, msg_type, ts = obj["text"], obj["type"], obj["ts"]
+    except (KeyError, TypeError) as exc:
+        raise ValueError(f"Payload is not a chat message: {s!r}") from exc
 
+    # All three fields are present, so any other key is an unknown field.
+    if len(obj) != len(CHAT_MESSAGE_FIELDS):
+        raise ValueError(f"Chat message has unknown fields: {s!r}")
 
-def json_dumps(obj: Any) -> str:
-    return json.dumps(obj, cls=ChatMessageEncoder)
+    # Exact type checks: bool is an int subclass but not a valid timestamp.
+    if type(text) is not str or type(msg_type) is not str or type(ts) is not int:
+        raise ValueError(f"Chat message fields have the wrong types: {s!r}")
+    return ChatMessage(text=text, type=msg_type, ts=ts)
 
 
-def json_loads(s: str) -> ChatMessage | dict[str, Any]:
-    return json.loads(s, object_hook=chat_message_decoder)  # type: ignore[no-any-return]
+def dumps_bytes(obj: Any) -> bytes:
+    # orjson serializes dataclasses natively and emits UTF-8 bytes directly.
+    return orjson.dumps(obj)
@@ -4,35 +4,56 @@ import asyncio
 import contextlib
 import logging
 import time
+import uuid
 from collections.abc import Awaitable, Callable, Generator
 from typing import Any
 
 import redis.asyncio as redis
 from aiohttp import web
 
-from server.metrics import ERRORS_TOTAL, track_redis_operation
-from server.models import ChatMessage, json_dumps, json_loads
+from server.metrics import (
+    ERRORS_TOTAL,
+    PUBLISH_DROPPED_TOTAL,
+    record_published_messages,
+    track_redis_operation,
+)
+from server.models import ChatMessage, chat_message_from_bytes
 
 logger = logging.getLogger(__name__)
 
 
-MessageHandler = Callable[[ChatMessage], Awaitable[None]]
+# Handlers receive the JSON payload of each chat message as published.
+MessageHandler = Callable[[bytes], Awaitable[None]]
 
 
 SECONDS_IN_MINUTE = 60
 MS_IN_SECOND = 1_000
 
+PUBLISH_FLUSH_TIMEOUT = 1.0
+
 
 class RedisManager:
     STREAM_KEY = "chat:messages"
     MAX_STREAM_LENGTH = 10_000
+    MAX_PUBLISH_BATCH = 100
+    MAX_PUBLISH_QUEUE = 1_000
 
     def __init__(self, redis_url: str) -> None:
         self.redis_url = redis_url
         self.client: redis.Redis | None = None
         self._listener_task: asyncio.Task[None] | None = None
+        self._publisher_task: asyncio.Task[None] | None = None
+        # Payloads waiting to be published, with the time they were queued.
+        # Bounded so a slow or unreachable Redis pushes back on the senders
+        # instead of growing memory without limit.
+        self._publish_queue: asyncio.Queue[tuple[bytes, float]] = asyncio.Queue(
+            maxsize=self.MAX_PUBLISH_QUEUE
+        )
         self._message_handler: MessageHandler | None = None
         self._last_id: str = "$"  # Start reading from new messages
+        # Tags entries published by this process so the listener can skip
+        # them; the publisher already delivered them to its local peers.
+        self.origin_id = uuid.uuid4().hex
 
     async def connect(self) -> None:
         if self.client:
@@ -46,12 +67,24 @@ class RedisManager:
                 decode_responses=True,
             )
 
+        self._publisher_task = asyncio.create_task(self._publish_loop())
+
     async def disconnect(self) -> None:
         if self._listener_task and not self._listener_task.done():
             self._listener_task.cancel()
             with contextlib.suppress(asyncio.CancelledError):
                 await self._listener_task
 
+        if self._publisher_task and not self._publisher_task.done():
+            # Best-effort flush of messages queued right before shutdown.
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(
+                    self._publish_queue.join(), timeout=PUBLISH_FLUSH_TIMEOUT
+                )
+            self._publisher_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._publisher_task
+
         if self.client:
             with track_redis_operation("disconnect"):
                 await self.client.aclose()
@@ -81,18 +114,50 @@ class RedisManager:
 
         return messages
 
-    async def publish_message(self, message: ChatMessage) -> None:
+    async def publish_message(self, payload: bytes) -> None:
         if self.client is None:
             raise RuntimeError("Redis client not connected!")
 
-        payload = json_dumps(message)
-        with track_redis_operation("xadd"):
-            await self.client.xadd(
+        # The publisher task coalesces queued messages into a single pipeline.
+        # When the queue is full this waits for room, so the sender's socket
+        # stops being read until the publisher catches up.
+        await self._publish_queue.put((payload, time.perf_counter()))
+
+    async def _publish_loop(self) -> None:
+        while True:
+            batch = [await self._publish_queue.get()]
+            while (
+                len(batch) < self.MAX_PUBLISH_BATCH and not self._publish_queue.empty()
+            ):
+                batch.append(self._publish_queue.get_nowait())
+
+            try:
+                await self._publish_batch([payload for payload, _ in batch])
+            except Exception:
+                ERRORS_TOTAL.labels(type="redis_error").inc()
+                PUBLISH_DROPPED_TOTAL.inc(len(batch))
+                logger.exception(
+                    "Failed to publish %d message(s), dropping them!", len(batch)
+                )
+            else:
+                record_published_messages([queued_at for _, queued_at in batch])
+            finally:
+                for _ in batch:
+                    self._publish_queue.task_done()
+
+    async def _publish_batch(self, payloads: list[bytes]) -> None:
+        assert self.client
+
+        pipe = self.client.pipeline(transaction=False)
+        for payload in payloads:
+            pipe.xadd(
                 name=self.STREAM_KEY,
-                fields={"data": payload},
+                fields={"data": payload, "origin": self.origin_id},
                 maxlen=self.MAX_STREAM_LENGTH,
                 approximate=True,  # More efficient auto-trimming
             )
+        with track_redis_operation("xadd"):
+            await pipe.execute()
 
     async def start_listen(self) -> None:
         if not self.client:
@@ -120,12 +185,20 @@ class RedisManager:
                     # Timeout, no new messages in last 5 seconds
                     continue
 
+                handler = self._message_handler
                 for _, response in stream_data:
-                    messages = self.extract_messages_from_response(response)
-                    for message_id, message in messages:
-                        self._last_id = message_id
-                        if self._message_handler:
-                            await self._message_handler(message)
+                    if response:
+                        # Advance past every entry read, including skipped ones.
+                        self._last_id = response[-1][0]
+                    if handler is None:
+                        # Nobody to deliver to; don't bother extracting.
+                        continue
+
+                    payloads = self.extract_payloads_from_response(
+                        response, skip_origin=self.origin_id
+                    )
+                    for _, payload in payloads:
+                        await handler(payload)
         except asyncio.CancelledError as exc:
             logger.info("Client listener is cancelled.")
             raise exc
@@ -135,6 +208,31 @@ class RedisManager:
             # Re-raise to fail fast rather than silently stopping message processing
             raise
 
+    def extract_payloads_from_response(
+        self,
+        response: list[tuple[str, dict[str, Any]]],
+        skip_origin: str | None = None,
+    ) -> Generator[tuple[str, bytes]]:
+        """Yield the raw JSON payload of each valid chat message entry.
+
+        Every payload is still checked, since anything can XADD to the stream
+        and one bad entry would corrupt a whole coalesced broadcast frame. The
+        original bytes are forwarded rather than re-serialized.
+        """
+        for message_id, fields in response:
+            if skip_origin is not None and fields.get("origin") == skip_origin:
+                continue
+
+            payload = fields.get("data")
+            if not payload:
+                logger.warning("Message %s has no 'data' field!", message_id)
+                continue
+
+            if self._parse_entry(message_id, payload) is None:
+                continue
+
+            yield message_id, payload.encode("utf-8")
+
     def extract_messages_from_response(
         self, response: list[tuple[str, dict[str, Any]]]
     ) -> Generator[tuple[str, ChatMessage]]:
@@ -144,27 +242,30 @@ class RedisManager:
                 logger.warning("Message %s has no 'data' field!", message_id)
                 continue
 
-            try:
-                chat_message = json_loads(payload)
-                if isinstance(chat_message, ChatMessage):
-                    yield message_id, chat_message
-                else:
-                    logger.warning(
-                        "Message %s has invalid format: %s", message_id, payload
-                    )
-            except ValueError:
-                logger.exception(
-                    "Failed to parse message with id %s and payload %s!",
-                    message_id,
-                    payload,
-                    exc_info=True,
-                )
-            except Exception:
-                logger.warning(
-                    "Unknown exception occured while receiving message %s",
-                    message_id,
-                    exc_info=True,
-                )
+            chat_message = self._parse_entry(message_id, payload)
+            if chat_message is None:
+                continue
+
+            yield message_id, chat_message
+
+    @staticmethod
+    def _parse_entry(message_id: str, payload: str) -> ChatMessage | None:
+        try:
+            return chat_message_from_bytes(payload)
+        except ValueError:
+            logger.exception(
+                "Failed to parse message with id %s and payload %s!",
+                message_id,
+                payload,
+                exc_info=True,
+            )
+        except Exception:
+            logger.warning(
+                "Unknown exception occured while receiving message %s",
+                message_id,
+                exc_info=True,
+            )
+        return None
 
 
 def install_redis_manager(app: web.Application, redis_url: str) -> RedisManager:
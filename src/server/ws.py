@@ -1,11 +1,16 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import logging
-from collections.abc import AsyncGenerator
+import socket
+import struct
+from collections.abc import AsyncGenerator, Callable, Coroutine, KeysView
 from contextlib import asynccontextmanager
-from enum import Enum, auto
+from enum import IntEnum, auto
+from typing import Any
 
+import orjson
 from aiohttp import WSCloseCode, WSMessage, WSMsgType, web
 
 from server.metrics import (
@@ -13,61 +18,166 @@ from server.metrics import (
     CONNECTIONS_TOTAL,
     DISCONNECTIONS_TOTAL,
     ERRORS_TOTAL,
-    track_message_processing,
 )
-from server.models import ChatMessage, json_dumps, json_loads
+from server.models import chat_message_from_bytes
 from server.redis import RedisManager
 
 logger = logging.getLogger(__name__)
 
 
-class PeerStatus(Enum):
+class PeerStatus(IntEnum):
     OK = auto()
     CLOSED = auto()
-    TIMEOUT = auto()
+    SLOW = auto()
     INTERNAL_ERROR = auto()
 
 
+# Close frames sent to peers dropped from a broadcast, keyed by failure reason
+PEER_CLOSE_REASONS: dict[PeerStatus, tuple[WSCloseCode, bytes]] = {
+    PeerStatus.SLOW: (WSCloseCode.GOING_AWAY, b"Too slow to keep up"),
+    PeerStatus.INTERNAL_ERROR: (
+        WSCloseCode.INTERNAL_ERROR,
+        b"Unknown internal error",
+    ),
+}
+
 WS_CLOSE_TIMEOUT = 2.0
-SEND_TIMEOUT = 0.25
+# Peers with more unsent bytes than this buffered in their transport are
+# treated as too slow and dropped instead of being awaited.
+PEER_WRITE_BUFFER_LIMIT = 256 * 1024
+# Kernel socket tuning applied to every accepted peer connection
+PEER_SNDBUF_SIZE = 256 * 1024
+PEER_NOTSENT_LOWAT = 16 * 1024
 WS_HEARTBEAT_INTERVAL = 25
 
 # WebSocket close codes
 WS_CLOSE_NORMAL = 1000
 WS_CLOSE_GOING_AWAY = 1001
 
+# Upper bound on close handshakes the closer task runs concurrently
+MAX_CLOSE_BATCH = 64
+# Messages broadcast within this window are coalesced into one array frame
+BROADCAST_COALESCE_DELAY = 0.002
+
+# WebSocket framing (RFC 6455, section 5.2): FIN bit set + TEXT opcode
+WS_FIN_TEXT = 0x81
+WS_PAYLOAD_LEN_16 = 126
+WS_PAYLOAD_LEN_64 = 127
+
+_PACK_LEN_7 = struct.Struct("!BB").pack
+_PACK_LEN_16 = struct.Struct("!BBH").pack
+_PACK_LEN_64 = struct.Struct("!BBQ").pack
+
+
+def build_text_frame(payload: bytes) -> bytes:
+    """Build an unmasked, unfragmented TEXT frame for server-to-client sends.
+
+    Peers are accepted without compression, so the frame is identical for
+    every peer and can be built once per broadcast and written as-is to each
+    transport.
+    """
+    length = len(payload)
+    if length < WS_PAYLOAD_LEN_16:
+        header = _PACK_LEN_7(WS_FIN_TEXT, length)
+    elif length < 1 << 16:
+        header = _PACK_LEN_16(WS_FIN_TEXT, WS_PAYLOAD_LEN_16, length)
+    else:
+        header = _PACK_LEN_64(WS_FIN_TEXT, WS_PAYLOAD_LEN_64, length)
+    return header + payload
+
+
+def tune_peer_socket(req: web.Request) -> None:
+    """Tune a peer socket for low-latency broadcasts.
+
+    Nagle's algorithm is disabled so small chat frames go out immediately, a
+    low TCP_NOTSENT_LOWAT keeps unsent data in the kernel small so slow peers
+    show up as user-space backpressure, and a larger SO_SNDBUF absorbs bursts.
+    The transport's high-water mark is aligned with the broadcast drop
+    threshold, so a slow peer is dropped by the fan-out before it can pause
+    the writer.
+    """
+    transport = req.transport
+    if transport is None:
+        return
+
+    transport.set_write_buffer_limits(high=PEER_WRITE_BUFFER_LIMIT)
+
+    sock = transport.get_extra_info("socket")
+    if sock is None:
+        return
+
+    options = [
+        (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+        (socket.SOL_SOCKET, socket.SO_SNDBUF, PEER_SNDBUF_SIZE),
+    ]
+    # TCP_NOTSENT_LOWAT is only available on Linux and macOS.
+    notsent_lowat = getattr(socket, "TCP_NOTSENT_LOWAT", None)
+    if notsent_lowat is not None:
+        options.append((socket.IPPROTO_TCP, notsent_lowat, PEER_NOTSENT_LOWAT))
+
+    for level, option, value in options:
+        # Not every socket family supports these options (e.g. UNIX sockets).
+        with contextlib.suppress(OSError):
+            sock.setsockopt(level, option, value)
+
 
 class WSMessageRouter:
     def __init__(self, redis_manager: RedisManager) -> None:
-        self.clients: set[web.WebSocketResponse] = set()
         self.redis = redis_manager
+        # Connected peers are kept as parallel lists so the broadcast loop only
+        # touches the transports it writes to. `_peer_index` maps each peer to
+        # its position for O(1) swap-removal.
+        self._peers: list[web.WebSocketResponse] = []
+        self._transports: list[asyncio.Transport] = []
+        self._peer_index: dict[web.WebSocketResponse, int] = {}
+        # Failed peers are closed by a single background task, started lazily
+        self._close_queue: asyncio.Queue[
+            tuple[web.WebSocketResponse, WSCloseCode, bytes]
+        ] = asyncio.Queue()
+        self._closer_task: asyncio.Task[None] | None = None
+        # Messages waiting for the next coalesced broadcast
+        self._pending_broadcasts: list[bytes] = []
+        self._flush_task: asyncio.Task[None] | None = None
+
+        # Handlers for inbound frame types; anything else ends the connection.
+        self._dispatch: dict[
+            WSMsgType, Callable[[WSMessage], Coroutine[Any, Any, None]]
+        ] = {WSMsgType.TEXT: self._handle_text}
 
         self.redis.set_message_handler(self._broadcast_to_local_peers)
 
     async def handler(self, req: web.Request) -> web.StreamResponse:
         async with self._initialize_ws(req) as ws:
+            dispatch = self._dispatch
             async for message in ws:
-                match message.type:
-                    case WSMsgType.TEXT:
-                        logger.info("Received message %s of type TEXT.", message)
-                        await self._handle_text(message)
-                    case WSMsgType.ERROR:
-                        ERRORS_TOTAL.labels(type="websocket_error").inc()
-                        logger.error("Received an Error message %s!", message)
-                        break
-                    case _ as msg_type:
-                        # TODO: Handle more WSMsgType.
-                        logger.warning(
-                            "Unknown message type %s! message=%s", msg_type, message
-                        )
-                        break
+                handle = dispatch.get(message.type)
+                if handle is not None:
+                    await handle(message)
+                    continue
+
+                if message.type is WSMsgType.ERROR:
+                    ERRORS_TOTAL.labels(type="websocket_error").inc()
+                    logger.error("Received an Error message %s!", message)
+                else:
+                    # TODO: Handle more WSMsgType.
+                    logger.warning(
+                        "Unknown message type %s! message=%s", message.type, message
+                    )
+                break
         return ws
 
     @asynccontextmanager
     async def _initialize_ws(
         self, req: web.Request
     ) -> AsyncGenerator[web.WebSocketResponse]:
-        ws = web.WebSocketResponse(heartbeat=WS_HEARTBEAT_INTERVAL)
+        # Compression is left off so every peer can share the pre-built
+        # broadcast frame; chat messages are too small to benefit from it.
+        # The close handshake is bounded by WS_CLOSE_TIMEOUT rather than
+        # aiohttp's 10s default, so an unresponsive peer releases its handler
+        # task quickly.
+        ws = web.WebSocketResponse(
+            timeout=WS_CLOSE_TIMEOUT, heartbeat=WS_HEARTBEAT_INTERVAL, compress=False
+        )
         logger.info("Connecting to WebSocket at address %s...", req.url)
 
         try:
@@ -76,10 +186,12 @@ class WSMessageRouter:
             CONNECTIONS_TOTAL.labels(status="upgrade_failed").inc()
             raise
 
+        tune_peer_socket(req)
+
         logger.info("Connection established to %s!", req.url)
         CONNECTIONS_TOTAL.labels(status="success").inc()
         CONNECTED_USERS.inc()
-        self.clients.add(ws)
+        self._add_client(ws)
 
         disconnect_reason = "normal"
         try:
@@ -91,7 +203,7 @@ class WSMessageRouter:
             disconnect_reason = "error"
             raise
         finally:
-            self.clients.discard(ws)
+            self._discard_client(ws)
             CONNECTED_USERS.dec()
 
             if ws.close_code == WSCloseCode.GOING_AWAY:
@@ -114,105 +226,211 @@ class WSMessageRouter:
             logger.info("Successfully disconnected.")
 
     async def close_all_connections(self) -> None:
-        if not self.clients:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._pending_broadcasts.clear()
+        if self._closer_task is not None:
+            # Peers still queued for closing are dropped with the process.
+            self._closer_task.cancel()
+            self._closer_task = None
+
+        if not self._peers:
             logger.info("No active WebSocket connections to close")
             return
 
-        logger.info("Closing %d active WebSocket connection(s)...", len(self.clients))
+        logger.info("Closing %d active WebSocket connection(s)...", len(self._peers))
 
+        closing_open_sockets = [
+            ws.close(code=WSCloseCode.GOING_AWAY, message=b"Server shutting down")
+            for ws in self._peers
+            if not ws.closed
+        ]
         try:
-            clients_snapshot = tuple(self.clients)
-            closing_open_sockets = (
-                ws.close(code=WSCloseCode.GOING_AWAY, message=b"Server shutting down")
-                for ws in clients_snapshot
-                if not ws.closed
-            )
-            await asyncio.wait_for(
-                asyncio.gather(*closing_open_sockets, return_exceptions=True),
-                timeout=WS_CLOSE_TIMEOUT,
-            )
+            async with asyncio.timeout(WS_CLOSE_TIMEOUT):
+                await asyncio.gather(*closing_open_sockets, return_exceptions=True)
         except TimeoutError:
             # Best-effort socket shutdown. Process is terminating anyway.
             logger.warning("Timeout while closing WebSocket connections")
 
-        self.clients.clear()
+        self._peers.clear()
+        self._transports.clear()
+        self._peer_index.clear()
 
     async def _handle_text(self, message: WSMessage) -> None:
         data = message.data
 
         try:
-            obj = json_loads(data)
-        except ValueError:
+            obj = chat_message_from_bytes(data)
+        except orjson.JSONDecodeError:
             ERRORS_TOTAL.labels(type="parse_error").inc()
             logger.warning("Failed to parse message %s", data, exc_info=True)
             return
+        except ValueError:
+            # Valid JSON, but not shaped like a chat message.
+            ERRORS_TOTAL.labels(type="invalid_message").inc()
+            logger.warning("Received invalid message format: %s", data)
+            return
         except Exception:
             ERRORS_TOTAL.labels(type="parse_error").inc()
-            logger.exception("Unexpected error while parsing message %s")
+            logger.exception("Unexpected error while parsing message %s", data)
             return
 
-        if not isinstance(obj, ChatMessage):
-            ERRORS_TOTAL.labels(type="invalid_message").inc()
-            logger.warning("Received invalid message format: %s", data)
+        # Serialized once; the same bytes are published and broadcast.
+        payload = obj.to_json()
+        await self.redis.publish_message(payload)
+        # Local peers are served directly; the Redis listener skips entries
+        # published by this process, saving the XREAD hop for them.
+        await self._broadcast_to_local_peers(payload)
+
+    @property
+    def clients(self) -> KeysView[web.WebSocketResponse]:
+        return self._peer_index.keys()
+
+    def _add_client(self, ws: web.WebSocketResponse) -> None:
+        if ws in self._peer_index:
             return
 
-        with track_message_processing():
-            await self.redis.publish_message(obj)
+        # Only prepared responses are added, so the writer always exists.
+        assert ws._writer is not None
+        self._peer_index[ws] = len(self._peers)
+        self._peers.append(ws)
+        self._transports.append(ws._writer.transport)
 
-    async def _broadcast_to_local_peers(self, message: ChatMessage) -> None:
-        payload = json_dumps(message)
+    def _discard_client(self, ws: web.WebSocketResponse) -> None:
+        index = self._peer_index.pop(ws, None)
+        if index is None:
+            return
 
-        # Snapshotting the clients set is necessary here, as during await a
-        # client can disconnect, causing a mutation of the clients set, which
-        # will cause the iteration to fail.
-        clients_snapshot = tuple(self.clients)
+        # Swap the last peer into the vacated slot to keep removal O(1).
+        last_peer = self._peers.pop()
+        last_transport = self._transports.pop()
+        if index < len(self._peers):
+            self._peers[index] = last_peer
+            self._transports[index] = last_transport
+            self._peer_index[last_peer] = index
+
+    async def _broadcast_to_local_peers(self, payload: bytes) -> None:
+        if not self._peers:
+            # Common on workers without local peers; skip the flush entirely.
+            return
 
-        broadcast_results = await asyncio.gather(
-            *(self._send_to_peer(peer, payload) for peer in clients_snapshot)
+        self._pending_broadcasts.append(payload)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_broadcasts())
+
+    async def _flush_broadcasts(self) -> None:
+        # Let messages arriving within the window share a single frame.
+        await asyncio.sleep(BROADCAST_COALESCE_DELAY)
+        payloads = self._pending_broadcasts
+        self._pending_broadcasts = []
+        self._flush_task = None
+
+        if len(payloads) == 1:
+            # A lone message keeps the plain object format.
+            payload = payloads[0]
+        else:
+            # Payloads are already JSON objects, so the array is spliced
+            # together without decoding them again.
+            payload = b"[" + b",".join(payloads) + b"]"
+
+        # Frame once; every peer gets the same bytes.
+        self._send_broadcast(build_text_frame(payload))
+
+    def _send_broadcast(self, frame: bytes) -> None:
+        # The loop below never awaits, so membership can't change under it;
+        # peers that failed are only removed once it is done.
+        failed_peers: list[tuple[web.WebSocketResponse, PeerStatus]] = []
+        for peer, transport in zip(self._peers, self._transports, strict=True):
+            result = self._write_frame_to_peer(peer, transport, frame)
+            if result is not PeerStatus.OK:
+                failed_peers.append((peer, result))
+
+        for peer, result in failed_peers:
+            self._discard_client(peer)
+            if result in PEER_CLOSE_REASONS:
+                # Closed in the background so a slow close handshake never
+                # stalls the next broadcast.
+                self._enqueue_close(peer, *PEER_CLOSE_REASONS[result])
+
+    def _enqueue_close(
+        self, peer: web.WebSocketResponse, code: WSCloseCode, message: bytes
+    ) -> None:
+        self._close_queue.put_nowait((peer, code, message))
+        if self._closer_task is None:
+            self._closer_task = asyncio.create_task(self._close_loop())
+
+    async def _close_loop(self) -> None:
+        while True:
+            batch = [await self._close_queue.get()]
+            while len(batch) < MAX_CLOSE_BATCH and not self._close_queue.empty():
+                batch.append(self._close_queue.get_nowait())
+
+            try:
+                await self._close_peers(batch)
+            finally:
+                for _ in batch:
+                    self._close_queue.task_done()
+
+    async def _close_peers(
+        self,
+        peers_to_close: list[tuple[web.WebSocketResponse, WSCloseCode, bytes]],
+    ) -> None:
+        await asyncio.gather(
+            *(
+                self._close_peer(peer, code, message)
+                for peer, code, message in peers_to_close
+            ),
+            return_exceptions=True,
         )
 
-        for peer, result in zip(clients_snapshot, broadcast_results, strict=True):
-            if result != PeerStatus.OK:
-                self.clients.discard(peer)
+    @staticmethod
+    async def _close_peer(
+        peer: web.WebSocketResponse, code: WSCloseCode, message: bytes
+    ) -> None:
+        """Close a dropped peer, aborting its transport if the close stalls.
+
+        aiohttp's close() drains the writer without a timeout, so a slow peer
+        that stops reading would otherwise hold up every later close.
+        """
+        try:
+            async with asyncio.timeout(WS_CLOSE_TIMEOUT):
+                await peer.close(code=code, message=message)
+        except TimeoutError:
+            logger.warning("Timeout while closing %s, aborting it.", peer)
+            if peer._writer is not None:
+                peer._writer.transport.abort()
 
-    async def _send_to_peer(
-        self, peer: web.WebSocketResponse, payload: str
+    @staticmethod
+    def _write_frame_to_peer(
+        peer: web.WebSocketResponse, transport: asyncio.Transport, frame: bytes
     ) -> PeerStatus:
+        """Write a pre-built frame without awaiting; transport.write only buffers.
+
+        Backpressure is detected from the transport's buffer size instead of a
+        per-send timeout, so a slow peer never stalls the rest of the fan-out.
+        """
         if peer.closed:
-            logger.info("Connection to %s is closed.", peer)
+            logger.debug("Connection to %s is closed.", peer)
             return PeerStatus.CLOSED
 
-        try:
-            await asyncio.wait_for(peer.send_str(payload), timeout=SEND_TIMEOUT)
-        except TimeoutError:
+        if transport.is_closing():
+            logger.debug("Connection to %s is closing.", peer)
+            return PeerStatus.CLOSED
+
+        buffered = transport.get_write_buffer_size()
+        if buffered > PEER_WRITE_BUFFER_LIMIT:
             logger.warning(
-                "Connection to %s timed out after %s seconds while sending message %s.",
+                "Connection to %s has %d bytes of unsent data, dropping it.",
                 peer,
-                SEND_TIMEOUT,
-                payload,
+                buffered,
             )
-            # add_done_callback prevents 'Task was destroyed but pending' warnings
-            asyncio.create_task(
-                peer.close(
-                    code=WSCloseCode.GOING_AWAY,
-                    message=b"Send timeout",
-                )
-            ).add_done_callback(lambda _: _)
-            return PeerStatus.TIMEOUT
+            return PeerStatus.SLOW
+
+        try:
+            transport.write(frame)
         except Exception:
-            # TODO: Hard-exit for unexpected error?
-            logger.exception(
-                "Unknown internal error for %s while sending message %s!",
-                peer,
-                payload,
-            )
-            # add_done_callback prevents 'Task was destroyed but pending' warnings
-            asyncio.create_task(
-                peer.close(
-                    code=WSCloseCode.INTERNAL_ERROR,
-                    message=b"Unknown internal error",
-                )
-            ).add_done_callback(lambda _: _)
+            logger.exception("Unknown internal error for %s while writing frame!", peer)
             return PeerStatus.INTERNAL_ERROR
 
         return PeerStatus.OK
@@ -0,0 +1,20 @@
+import pytest
+
+from server.models import ChatMessage
+
+
+# ChatMessage is frozen, so one instance and its encodings are shared by the
+# whole session.
+@pytest.fixture(scope="session")
+def sample_message() -> ChatMessage:
+    return ChatMessage(text="Test message", type="message", ts=1234567890)
+
+
+@pytest.fixture(scope="session")
+def sample_json(sample_message: ChatMessage) -> str:
+    return sample_message.to_json().decode()
+
+
+@pytest.fixture(scope="session")
+def sample_payload(sample_json: str) -> bytes:
+    return sample_json.encode()
@@ -1,13 +1,39 @@
-from unittest.mock import AsyncMock, MagicMock
+import argparse
+import os
+import re
+import signal
+import socket
+from collections.abc import Callable
+from types import FrameType
+from unittest.mock import AsyncMock, MagicMock, call
 
 import pytest
 from aiohttp import web
 
-from server.app import get_messages, healthz
+from server import app
+from server.app import (
+    accepts_gzip,
+    bind_listening_sockets,
+    fork_worker,
+    get_messages,
+    healthz,
+    index,
+    main,
+    reap_worker,
+    shutdown_workers,
+)
 from server.models import ChatMessage
 
 HTTP_OK = 200
 HTTP_INTERNAL_SERVER_ERROR = 500
+RE_NOT_AN_INTEGER = re.compile("not a valid integer")
+RE_NOT_POSITIVE = re.compile("must be a positive number")
+RE_TOO_LARGE = re.compile("cannot be more than 24 hours")
+WORKER_PID = 4242
+OTHER_PID = 4343
+SHUTDOWN_TIMEOUT = 2
+
+SignalHandler = Callable[[int, FrameType | None], None]
 
 
 class TestHealthzEndpoint:
@@ -19,6 +45,56 @@ class TestHealthzEndpoint:
         assert response.content_type == "application/json"
 
 
+class TestIndexEndpoint:
+    INDEX_PAGE = (b"<html></html>", b"gzipped")
+
+    async def test_index_serves_gzip_when_accepted(self) -> None:
+        mock_request = MagicMock()
+        mock_request.app = {"index_page": self.INDEX_PAGE}
+        mock_request.headers = {"Accept-Encoding": "gzip, deflate"}
+
+        response = await index(mock_request)
+
+        assert response.status == HTTP_OK
+        assert response.body == b"gzipped"
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert response.content_type == "text/html"
+
+    async def test_index_serves_raw_without_gzip(self) -> None:
+        mock_request = MagicMock()
+        mock_request.app = {"index_page": self.INDEX_PAGE}
+        mock_request.headers = {}
+
+        response = await index(mock_request)
+
+        assert response.status == HTTP_OK
+        assert response.body == b"<html></html>"
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["Vary"] == "Accept-Encoding"
+
+    @pytest.mark.parametrize(
+        ("accept_encoding", "expected"),
+        [
+            ("gzip", True),
+            ("deflate, GZIP;q=0.5", True),
+            ("x-gzip", True),
+            ("*", True),
+            ("*;q=0, gzip", True),
+            ("", False),
+            ("deflate, br", False),
+            ("gzip;q=0", False),
+            ("gzip; q=0.000", False),
+            ("gzip;q=0, *", False),
+            ("*;q=0", False),
+            ("notgzip", False),
+            ("gzip;q=bogus", False),
+        ],
+    )
+    def test_accepts_gzip(self, accept_encoding: str, expected: bool) -> None:
+        assert accepts_gzip(accept_encoding) is expected
+
+
 class TestGetMessagesEndpoint:
     async def test_get_messages_valid_minutes(self) -> None:
         mock_redis = AsyncMock()
@@ -36,27 +112,40 @@ class TestGetMessagesEndpoint:
         response = await get_messages(mock_request)
 
         assert response.status == HTTP_OK
+        assert response.content_type == "application/json"
+        assert response.body == (
+            b'{"messages":[{"text":"test1","type":"message","ts":1234567890},'
+            b'{"text":"test2","type":"message","ts":1234567891}]}'
+        )
         mock_redis.fetch_history.assert_called_once_with(minutes=30)
 
     async def test_get_messages_invalid_minutes_non_numeric(self) -> None:
         mock_request = MagicMock()
         mock_request.query.get.return_value = "invalid"
 
-        with pytest.raises(web.HTTPBadRequest, match="not a valid integer"):
+        with pytest.raises(web.HTTPBadRequest, match=RE_NOT_AN_INTEGER):
             await get_messages(mock_request)
 
     async def test_get_messages_invalid_minutes_negative(self) -> None:
         mock_request = MagicMock()
         mock_request.query.get.return_value = "-1"
 
-        with pytest.raises(web.HTTPBadRequest, match="must be a positive number"):
+        # The sign fails the digit check before the range checks run
+        with pytest.raises(web.HTTPBadRequest, match=RE_NOT_AN_INTEGER):
+            await get_messages(mock_request)
+
+    async def test_get_messages_invalid_minutes_zero(self) -> None:
+        mock_request = MagicMock()
+        mock_request.query.get.return_value = "0"
+
+        with pytest.raises(web.HTTPBadRequest, match=RE_NOT_POSITIVE):
             await get_messages(mock_request)
 
     async def test_get_messages_invalid_minutes_too_large(self) -> None:
         mock_request = MagicMock()
         mock_request.query.get.return_value = "2000"
 
-        with pytest.raises(web.HTTPBadRequest, match="cannot be more than 24 hours"):
+        with pytest.raises(web.HTTPBadRequest, match=RE_TOO_LARGE):
             await get_messages(mock_request)
 
     async def test_get_messages_default_minutes(self) -> None:
@@ -82,3 +171,247 @@ class TestGetMessagesEndpoint:
         response = await get_messages(mock_request)
 
         assert response.status == HTTP_INTERNAL_SERVER_ERROR
+
+
+class FakeClock:
+    """Stands in for the time module so shutdown deadlines pass instantly."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class ChildExitError(Exception):
+    def __init__(self, code: int) -> None:
+        super().__init__(code)
+        self.code = code
+
+
+def child_exit(code: int) -> None:
+    raise ChildExitError(code)
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(app, "time", clock)
+    return clock
+
+
+class TestBindListeningSockets:
+    def test_bind_listening_sockets_are_inheritable(self) -> None:
+        socks = bind_listening_sockets("127.0.0.1", 0)
+        try:
+            assert [sock.family for sock in socks] == [socket.AF_INET]
+            assert socks[0].get_inheritable()
+            assert socks[0].getsockname()[1] != 0
+        finally:
+            for sock in socks:
+                sock.close()
+
+    def test_bind_listening_sockets_resolves_hostname(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        ipv4 = (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 8080))
+        ipv6 = (socket.AF_INET6, socket.SOCK_STREAM, 6, "", ("::1", 8080, 0, 0))
+        # Resolvers can return the same address more than once.
+        getaddrinfo = MagicMock(return_value=[ipv6, ipv4, ipv4])
+        create_server = MagicMock()
+        monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+        monkeypatch.setattr(socket, "create_server", create_server)
+
+        socks = bind_listening_sockets("localhost", 8080)
+
+        getaddrinfo.assert_called_once_with(
+            "localhost", 8080, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE
+        )
+        assert create_server.call_args_list == [
+            call(("::1", 8080, 0, 0), family=socket.AF_INET6),
+            call(("127.0.0.1", 8080), family=socket.AF_INET),
+        ]
+        assert len(socks) == len(create_server.call_args_list)
+        create_server.return_value.set_inheritable.assert_called_with(True)
+
+    def test_bind_listening_sockets_closes_bound_on_error(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        ipv4 = (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 8080))
+        ipv6 = (socket.AF_INET6, socket.SOCK_STREAM, 6, "", ("::1", 8080, 0, 0))
+        bound = MagicMock()
+        monkeypatch.setattr(socket, "getaddrinfo", MagicMock(return_value=[ipv4, ipv6]))
+        monkeypatch.setattr(
+            socket, "create_server", MagicMock(side_effect=[bound, OSError])
+        )
+
+        with pytest.raises(OSError):
+            bind_listening_sockets("localhost", 8080)
+
+        bound.close.assert_called_once_with()
+
+
+class TestReapWorker:
+    @pytest.mark.parametrize(
+        ("waitpid_result", "reaped"),
+        [((WORKER_PID, 0), True), ((0, 0), False)],
+    )
+    def test_reap_worker(
+        self,
+        waitpid_result: tuple[int, int],
+        reaped: bool,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        waitpid = MagicMock(return_value=waitpid_result)
+        monkeypatch.setattr(os, "waitpid", waitpid)
+
+        assert reap_worker(WORKER_PID) is reaped
+        waitpid.assert_called_once_with(WORKER_PID, os.WNOHANG)
+
+    def test_reap_worker_already_gone(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(os, "waitpid", MagicMock(side_effect=ChildProcessError))
+
+        assert reap_worker(WORKER_PID)
+
+
+class TestShutdownWorkers:
+    def test_shutdown_workers_reaps_until_exited(
+        self, clock: FakeClock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        kill = MagicMock()
+        # The first worker exits right away, the second on the next poll.
+        waitpid = MagicMock(
+            side_effect=[(WORKER_PID, 0), (0, 0), (OTHER_PID, 0)],
+        )
+        monkeypatch.setattr(os, "kill", kill)
+        monkeypatch.setattr(os, "waitpid", waitpid)
+
+        shutdown_workers([WORKER_PID, OTHER_PID])
+
+        assert kill.call_args_list == [
+            call(WORKER_PID, signal.SIGTERM),
+            call(OTHER_PID, signal.SIGTERM),
+        ]
+        assert waitpid.call_args_list == [
+            call(WORKER_PID, os.WNOHANG),
+            call(OTHER_PID, os.WNOHANG),
+            call(OTHER_PID, os.WNOHANG),
+        ]
+        assert 0 < clock.now < 1
+
+    def test_shutdown_workers_kills_after_timeout(
+        self, clock: FakeClock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        kill = MagicMock()
+        # The worker ignores SIGTERM and is only reaped after SIGKILL.
+        waitpid = MagicMock(
+            side_effect=lambda pid, options: (0, 0) if options else (pid, 0)
+        )
+        monkeypatch.setattr(os, "kill", kill)
+        monkeypatch.setattr(os, "waitpid", waitpid)
+
+        shutdown_workers([WORKER_PID], timeout=SHUTDOWN_TIMEOUT)
+
+        assert kill.call_args_list == [
+            call(WORKER_PID, signal.SIGTERM),
+            call(WORKER_PID, signal.SIGKILL),
+        ]
+        assert waitpid.call_args == call(WORKER_PID, 0)
+        assert clock.now >= SHUTDOWN_TIMEOUT
+
+    def test_shutdown_workers_ignores_missing_workers(
+        self, clock: FakeClock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(os, "kill", MagicMock(side_effect=ProcessLookupError))
+        monkeypatch.setattr(os, "waitpid", MagicMock(side_effect=ChildProcessError))
+
+        shutdown_workers([WORKER_PID, OTHER_PID])
+
+        assert clock.now == 0
+
+
+class TestForkWorker:
+    def test_fork_worker_returns_pid_in_parent(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        run_worker = MagicMock()
+        monkeypatch.setattr(os, "fork", MagicMock(return_value=WORKER_PID))
+        monkeypatch.setattr(app, "run_worker", run_worker)
+
+        assert fork_worker(1, [MagicMock()], "redis://test") == WORKER_PID
+        run_worker.assert_not_called()
+
+    @pytest.mark.parametrize(
+        ("side_effect", "exit_code"),
+        [(None, 0), (RuntimeError("boom"), 1)],
+    )
+    def test_fork_worker_child_exits(
+        self,
+        side_effect: Exception | None,
+        exit_code: int,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        socks: list[socket.socket] = [MagicMock()]
+        run_worker = MagicMock(side_effect=side_effect)
+        monkeypatch.setattr(os, "fork", MagicMock(return_value=0))
+        monkeypatch.setattr(os, "_exit", child_exit)
+        monkeypatch.setattr(app, "run_worker", run_worker)
+
+        with pytest.raises(ChildExitError) as exc_info:
+            fork_worker(1, socks, "redis://test")
+
+        assert exc_info.value.code == exit_code
+        run_worker.assert_called_once_with(1, socks, "redis://test")
+
+
+class TestMain:
+    @pytest.fixture
+    def kill(self, clock: FakeClock, monkeypatch: pytest.MonkeyPatch) -> MagicMock:
+        args = argparse.Namespace(
+            host="127.0.0.1", port=8080, redis_url="redis://test", workers=2
+        )
+        pids = iter([WORKER_PID, OTHER_PID])
+        monkeypatch.setattr(app, "parse_args", lambda: args)
+        monkeypatch.setattr(app, "bind_listening_sockets", MagicMock())
+        monkeypatch.setattr(app, "fork_worker", lambda *_: next(pids))
+        kill = MagicMock()
+        monkeypatch.setattr(os, "kill", kill)
+        return kill
+
+    def test_main_waits_for_every_worker(
+        self, kill: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        waitpid = MagicMock(side_effect=lambda pid, _: (pid, 0))
+        monkeypatch.setattr(os, "waitpid", waitpid)
+        monkeypatch.setattr(signal, "signal", MagicMock())
+
+        main()
+
+        assert waitpid.call_args_list == [call(WORKER_PID, 0), call(OTHER_PID, 0)]
+        # Reaped workers are never signalled; their PIDs may have been reused.
+        kill.assert_not_called()
+
+    def test_main_signal_only_stops_live_workers(
+        self, kill: MagicMock, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        handlers: dict[int, SignalHandler] = {}
+
+        def register(signum: int, handler: SignalHandler) -> None:
+            handlers[signum] = handler
+
+        def waitpid(pid: int, options: int) -> tuple[int, int]:
+            if pid == OTHER_PID and not options and not kill.called:
+                # SIGTERM arrives while the second worker is still running.
+                handlers[signal.SIGTERM](signal.SIGTERM, None)
+            return pid, 0
+
+        monkeypatch.setattr(signal, "signal", register)
+        monkeypatch.setattr(os, "waitpid", waitpid)
+
+        with pytest.raises(SystemExit):
+            main()
+
+        kill.assert_called_once_with(OTHER_PID, signal.SIGTERM)
@@ -1,6 +1,9 @@
+import time
+
 import pytest
+from prometheus_client import REGISTRY
 
-from server.metrics import track_message_processing, track_redis_operation
+from server.metrics import record_published_messages, track_redis_operation
 
 
 class TestMetricsContextManagers:
@@ -12,10 +15,33 @@ class TestMetricsContextManagers:
         with pytest.raises(ValueError), track_redis_operation("test_operation"):
             raise ValueError("Test error")
 
-    def test_track_message_processing_success(self) -> None:
-        with track_message_processing():
-            pass
+    def test_track_redis_operation_counts_by_label(self) -> None:
+        def sample(status: str) -> float:
+            value = REGISTRY.get_sample_value(
+                "webchat_redis_operations_total",
+                {"operation": "test_counted", "status": status},
+            )
+            return value or 0.0
+
+        success_before = sample("success")
+        error_before = sample("error")
 
-    def test_track_message_processing_with_error(self) -> None:
-        with pytest.raises(ValueError), track_message_processing():
+        with track_redis_operation("test_counted"):
+            pass
+        with pytest.raises(ValueError), track_redis_operation("test_counted"):
             raise ValueError("Test error")
+
+        assert sample("success") == success_before + 1
+        assert sample("error") == error_before + 1
+
+    def test_record_published_messages(self) -> None:
+        def sample(name: str) -> float:
+            return REGISTRY.get_sample_value(name) or 0.0
+
+        messages_before = sample("webchat_messages_total")
+        latency_before = sample("webchat_message_latency_seconds_count")
+
+        record_published_messages([time.perf_counter(), time.perf_counter()])
+
+        assert sample("webchat_messages_total") == messages_before + 2
+        assert sample("webchat_message_latency_seconds_count") == latency_before + 2
@@ -1,14 +1,20 @@
-import json
+import re
 from dataclasses import FrozenInstanceError
 
 import pytest
 
-from server.models import ChatMessage, json_dumps, json_loads
+from server.models import ChatMessage, chat_message_from_bytes
 
 # Test constants
 SAMPLE_TIMESTAMP_1 = 1234567890
 SAMPLE_TIMESTAMP_2 = 9876543210
-SAMPLE_TIMESTAMP_3 = 1111111111
+UNICODE_TEXT = "Hello 🌍 世界 emoji test! 🚀"
+INVALID_JSON = "invalid json"
+MISSING_FIELDS_JSON = '{"text": "Missing fields"}'
+EXTRA_FIELDS_JSON = '{"text": "Test", "type": "message", "ts": 123, "extra": "ignored"}'
+RE_NOT_A_CHAT_MESSAGE = re.compile("not a chat message")
+RE_WRONG_TYPES = re.compile("wrong types")
+RE_UNKNOWN_FIELDS = re.compile("unknown fields")
 
 
 class TestChatMessage:
@@ -19,47 +25,25 @@ class TestChatMessage:
         assert message.type == "message"
         assert message.ts == SAMPLE_TIMESTAMP_1
 
-    def test_to_json(self) -> None:
-        message = ChatMessage(
-            text="Test message", type="broadcast", ts=SAMPLE_TIMESTAMP_2
-        )
-        json_str = json_dumps(message)
-
-        parsed = json.loads(json_str)
-        assert parsed["text"] == "Test message"
-        assert parsed["type"] == "broadcast"
-        assert parsed["ts"] == SAMPLE_TIMESTAMP_2
-
-    def test_from_json_valid(self) -> None:
-        json_str = (
-            f'{{"text": "From JSON", "type": "alert", "ts": {SAMPLE_TIMESTAMP_3}}}'
-        )
-        message = json_loads(json_str)
-
-        assert isinstance(message, ChatMessage)
-        assert message.text == "From JSON"
-        assert message.type == "alert"
-        assert message.ts == SAMPLE_TIMESTAMP_3
-
-    def test_from_json_invalid_json(self) -> None:
-        with pytest.raises(json.JSONDecodeError):
-            json_loads("invalid json")
-
-    def test_from_json_missing_fields(self) -> None:
-        obj = json_loads('{"text": "Missing fields"}')
-        assert not isinstance(obj, ChatMessage)
-
-    def test_from_json_extra_fields_throw_error(self) -> None:
-        json_str = '{"text": "Test", "type": "message", "ts": 123, "extra": "ignored"}'
-        with pytest.raises(TypeError):
-            json_loads(json_str)
-
-    def test_round_trip_serialization(self) -> None:
-        original = ChatMessage(text="Round trip test", type="system", ts=5555555555)
-        json_str = json_dumps(original)
-        restored = json_loads(json_str)
-
-        assert original == restored
+    @pytest.mark.parametrize(
+        ("text", "type_", "ts"),
+        [
+            ("Hello world", "message", SAMPLE_TIMESTAMP_1),
+            ("Test message", "broadcast", SAMPLE_TIMESTAMP_2),
+            ("Round trip test", "system", 5555555555),
+            ("", "empty", 0),
+            # orjson writes non-ASCII characters as UTF-8 rather than \u escapes.
+            (UNICODE_TEXT, "unicode", 777),
+        ],
+        ids=["message", "broadcast", "system", "empty_text", "unicode_text"],
+    )
+    def test_round_trip(self, text: str, type_: str, ts: int) -> None:
+        message = ChatMessage(text=text, type=type_, ts=ts)
+
+        payload = message.to_json()
+
+        assert payload == f'{{"text":"{text}","type":"{type_}","ts":{ts}}}'.encode()
+        assert chat_message_from_bytes(payload) == message
 
     def test_frozen_dataclass(self) -> None:
         message = ChatMessage(text="Immutable", type="test", ts=123)
@@ -67,6 +51,19 @@ class TestChatMessage:
         with pytest.raises(FrozenInstanceError):
             message.text = "Changed"  # type: ignore[misc]
 
+    def test_slotted_dataclass(self) -> None:
+        message = ChatMessage(text="Slotted", type="test", ts=123)
+
+        assert not hasattr(message, "__dict__")
+
+    def test_to_json_keeps_field_types_of_equal_messages(self) -> None:
+        # True == 1, so the messages compare equal but must not share an encoding.
+        flag = ChatMessage(text="Typed", type="test", ts=True)
+        number = ChatMessage(text="Typed", type="test", ts=1)
+
+        assert flag.to_json() == b'{"text":"Typed","type":"test","ts":true}'
+        assert number.to_json() == b'{"text":"Typed","type":"test","ts":1}'
+
     def test_keyword_only_constructor(self) -> None:
         # Should work with keywords
         message = ChatMessage(text="KW only", type="test", ts=456)
@@ -76,23 +73,40 @@ class TestChatMessage:
         with pytest.raises(TypeError):
             ChatMessage("Positional", "test", 789)  # type: ignore[misc]
 
-    def test_empty_text(self) -> None:
-        message = ChatMessage(text="", type="empty", ts=0)
-        json_str = json_dumps(message)
-        restored = json_loads(json_str)
 
-        assert isinstance(restored, ChatMessage)
-        assert restored.text == ""
-        assert restored.type == "empty"
-        assert restored.ts == 0
+class TestChatMessageFromBytes:
+    def test_valid_payload(self) -> None:
+        payload = f'{{"text": "Hi", "type": "message", "ts": {SAMPLE_TIMESTAMP_1}}}'
+
+        message = chat_message_from_bytes(payload.encode())
+
+        assert message == ChatMessage(text="Hi", type="message", ts=SAMPLE_TIMESTAMP_1)
+
+    def test_invalid_json(self) -> None:
+        with pytest.raises(ValueError):
+            chat_message_from_bytes(INVALID_JSON)
+
+    def test_missing_fields(self) -> None:
+        with pytest.raises(ValueError, match=RE_NOT_A_CHAT_MESSAGE):
+            chat_message_from_bytes(MISSING_FIELDS_JSON)
 
-    def test_unicode_text(self) -> None:
-        unicode_text = "Hello 🌍 世界 emoji test! 🚀"
-        message = ChatMessage(text=unicode_text, type="unicode", ts=777)
+    def test_not_an_object(self) -> None:
+        with pytest.raises(ValueError, match=RE_NOT_A_CHAT_MESSAGE):
+            chat_message_from_bytes(b"[1, 2, 3]")
 
-        json_str = json_dumps(message)
-        restored = json_loads(json_str)
+    def test_extra_fields(self) -> None:
+        with pytest.raises(ValueError, match=RE_UNKNOWN_FIELDS):
+            chat_message_from_bytes(EXTRA_FIELDS_JSON)
 
-        assert isinstance(restored, ChatMessage)
-        assert restored.text == unicode_text
-        assert restored == message
+    @pytest.mark.parametrize(
+        "payload",
+        [
+            b'{"text": 1, "type": "message", "ts": 1}',
+            b'{"text": "Hi", "type": null, "ts": 1}',
+            b'{"text": "Hi", "type": "message", "ts": "1"}',
+            b'{"text": "Hi", "type": "message", "ts": true}',
+        ],
+    )
+    def test_wrong_field_types(self, payload: bytes) -> None:
+        with pytest.raises(ValueError, match=RE_WRONG_TYPES):
+            chat_message_from_bytes(payload)
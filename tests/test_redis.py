@@ -1,37 +1,68 @@
 import asyncio
 import contextlib
-from unittest.mock import AsyncMock, MagicMock, patch
+import re
+from collections.abc import Generator, Iterator
+from typing import cast
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+from prometheus_client import REGISTRY
 
-from server.models import ChatMessage, json_dumps
 from server.redis import RedisManager
 
+# Expected error messages, compiled once for the module
+RE_CONNECT_TWICE = re.compile("Attempting to connect to Redis client twice!")
+RE_NOT_CONNECTED = re.compile("Redis client not connected!")
+
+
+class _TaskStub:
+    """The slice of asyncio.Task that disconnect() uses, counting cancels.
+
+    Awaiting it after cancel() raises CancelledError like a real task would.
+    """
+
+    def __init__(self, *, done: bool) -> None:
+        self._done = done
+        self.cancel_calls = 0
+
+    def done(self) -> bool:
+        return self._done
+
+    def cancel(self) -> bool:
+        self.cancel_calls += 1
+        return True
+
+    def __await__(self) -> Generator[None]:
+        if self.cancel_calls:
+            raise asyncio.CancelledError
+        yield from ()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def mock_from_url() -> Iterator[MagicMock]:
+    # Patched once for the whole module; no test should reach a real Redis.
+    mock = MagicMock()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr("server.redis.redis.Redis.from_url", mock)
+        yield mock
+
 
 class TestRedisManager:
     @pytest.fixture
     def redis_manager(self) -> RedisManager:
         return RedisManager("redis://test:6379")
 
-    @pytest.fixture
-    def mock_redis_client(self) -> AsyncMock:
-        return AsyncMock()
-
-    @pytest.fixture
-    def sample_message(self) -> ChatMessage:
-        return ChatMessage(text="Test message", type="message", ts=1234567890)
-
     def test_init(self, redis_manager: RedisManager) -> None:
         assert redis_manager.redis_url == "redis://test:6379"
         assert redis_manager.client is None
         assert redis_manager._listener_task is None
         assert redis_manager._message_handler is None
 
-    @patch("server.redis.redis.Redis.from_url")
     async def test_connect(
         self, mock_from_url: MagicMock, redis_manager: RedisManager
     ) -> None:
         mock_client = AsyncMock()
+        mock_from_url.reset_mock()
         mock_from_url.return_value = mock_client
 
         await redis_manager.connect()
@@ -42,42 +73,42 @@ class TestRedisManager:
             encoding="utf-8",
             decode_responses=True,
         )
+        assert redis_manager._publisher_task is not None
+
+        await redis_manager.disconnect()
+        assert redis_manager._publisher_task.done()
 
     async def test_connect_twice_raises_error(
         self, redis_manager: RedisManager
     ) -> None:
         redis_manager.client = AsyncMock()  # Simulate already connected
 
-        with pytest.raises(
-            RuntimeError, match="Attempting to connect to Redis client twice!"
-        ):
+        with pytest.raises(RuntimeError, match=RE_CONNECT_TWICE):
             await redis_manager.connect()
 
     async def test_disconnect_with_active_task(
         self, redis_manager: RedisManager
     ) -> None:
         # Setup active listener task
-        mock_task = AsyncMock()
-        mock_task.done.return_value = False
-        redis_manager._listener_task = mock_task
+        task = _TaskStub(done=False)
+        redis_manager._listener_task = cast(asyncio.Task[None], task)
         redis_manager.client = AsyncMock()
 
         await redis_manager.disconnect()
 
-        mock_task.cancel.assert_called_once()
+        assert task.cancel_calls == 1
 
     async def test_disconnect_with_completed_task(
         self, redis_manager: RedisManager
     ) -> None:
         # Setup completed listener task
-        mock_task = AsyncMock()
-        mock_task.done.return_value = True
-        redis_manager._listener_task = mock_task
+        task = _TaskStub(done=True)
+        redis_manager._listener_task = cast(asyncio.Task[None], task)
         redis_manager.client = AsyncMock()
 
         await redis_manager.disconnect()
 
-        mock_task.cancel.assert_not_called()
+        assert task.cancel_calls == 0
         redis_manager.client.aclose.assert_called_once()
 
     async def test_disconnect_no_client(self, redis_manager: RedisManager) -> None:
@@ -91,85 +122,181 @@ class TestRedisManager:
         assert redis_manager._message_handler == handler
 
     async def test_publish_message(
-        self, redis_manager: RedisManager, sample_message: ChatMessage
+        self,
+        redis_manager: RedisManager,
+        sample_payload: bytes,
     ) -> None:
         mock_client = AsyncMock()
         redis_manager.client = mock_client
 
-        await redis_manager.publish_message(sample_message)
+        await redis_manager.publish_message(sample_payload)
+
+        # Publishing only enqueues; the publisher task writes to Redis.
+        mock_client.xadd.assert_not_called()
+        payload, _ = redis_manager._publish_queue.get_nowait()
+        assert payload == sample_payload
+
+    async def test_publish_message_waits_for_room(
+        self, sample_payload: bytes, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(RedisManager, "MAX_PUBLISH_QUEUE", 1)
+        redis_manager = RedisManager("redis://test:6379")
+        redis_manager.client = AsyncMock()
+
+        await redis_manager.publish_message(sample_payload)
+        blocked = asyncio.create_task(redis_manager.publish_message(sample_payload))
+        await asyncio.sleep(0)
+
+        # The full queue holds the second publish back until there is room.
+        assert not blocked.done()
+        redis_manager._publish_queue.get_nowait()
+        await blocked
+        assert redis_manager._publish_queue.qsize() == 1
+
+    @pytest.mark.parametrize(
+        ("publish_error", "published", "dropped"),
+        [(None, 1, 0), (ConnectionError("Redis is down"), 0, 1)],
+        ids=["published", "dropped"],
+    )
+    async def test_publish_loop_metrics(
+        self,
+        redis_manager: RedisManager,
+        sample_payload: bytes,
+        monkeypatch: pytest.MonkeyPatch,
+        publish_error: Exception | None,
+        published: int,
+        dropped: int,
+    ) -> None:
+        def sample(name: str) -> float:
+            return REGISTRY.get_sample_value(name) or 0.0
+
+        messages_before = sample("webchat_messages_total")
+        dropped_before = sample("webchat_publish_dropped_total")
+        monkeypatch.setattr(
+            redis_manager, "_publish_batch", AsyncMock(side_effect=publish_error)
+        )
+        redis_manager.client = AsyncMock()
 
-        mock_client.xadd.assert_called_once_with(
+        await redis_manager.publish_message(sample_payload)
+        publisher = asyncio.create_task(redis_manager._publish_loop())
+        await redis_manager._publish_queue.join()
+        publisher.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await publisher
+
+        # Dropped messages are counted on their own, never as published.
+        assert sample("webchat_messages_total") == messages_before + published
+        assert sample("webchat_publish_dropped_total") == dropped_before + dropped
+
+    async def test_publish_batch_uses_pipeline(
+        self, redis_manager: RedisManager, sample_payload: bytes
+    ) -> None:
+        mock_pipe = MagicMock()
+        mock_pipe.execute = AsyncMock()
+        mock_client = MagicMock()
+        mock_client.pipeline.return_value = mock_pipe
+        redis_manager.client = mock_client
+        payload = sample_payload
+
+        await redis_manager._publish_batch([payload, payload])
+
+        mock_client.pipeline.assert_called_once_with(transaction=False)
+        assert mock_pipe.xadd.call_count == 2  # noqa: PLR2004
+        mock_pipe.xadd.assert_called_with(
             name=RedisManager.STREAM_KEY,
-            fields={"data": json_dumps(sample_message)},
+            fields={"data": payload, "origin": redis_manager.origin_id},
             maxlen=RedisManager.MAX_STREAM_LENGTH,
             approximate=True,
         )
+        mock_pipe.execute.assert_awaited_once()
 
     async def test_publish_message_no_client(
-        self, redis_manager: RedisManager, sample_message: ChatMessage
+        self, redis_manager: RedisManager, sample_payload: bytes
     ) -> None:
-        with pytest.raises(RuntimeError, match="Redis client not connected!"):
-            await redis_manager.publish_message(sample_message)
+        with pytest.raises(RuntimeError, match=RE_NOT_CONNECTED):
+            await redis_manager.publish_message(sample_payload)
 
-    async def test_start_listen(self, redis_manager: RedisManager) -> None:
+    async def test_start_listen(
+        self, redis_manager: RedisManager, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
         mock_client = AsyncMock()
         redis_manager.client = mock_client
 
-        with patch.object(redis_manager, "_listen_loop"):
-            await redis_manager.start_listen()
+        started = asyncio.Event()
+
+        async def fake_loop() -> None:
+            started.set()
+            await asyncio.sleep(3600)
+
+        monkeypatch.setattr(redis_manager, "_listen_loop", fake_loop)
+        await redis_manager.start_listen()
 
-            assert redis_manager._listener_task is not None
-            # Need to let the task start
-            await asyncio.sleep(0.001)
+        assert redis_manager._listener_task is not None
+        await started.wait()
+
+        redis_manager._listener_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await redis_manager._listener_task
 
     async def test_start_listen_no_client(self, redis_manager: RedisManager) -> None:
-        with pytest.raises(RuntimeError, match="Redis client not connected!"):
+        with pytest.raises(RuntimeError, match=RE_NOT_CONNECTED):
             await redis_manager.start_listen()
 
     async def test_listen_loop_message_handling(
-        self, redis_manager: RedisManager, sample_message: ChatMessage
+        self, redis_manager: RedisManager, sample_json: str, sample_payload: bytes
     ) -> None:
         mock_client = AsyncMock()
         mock_handler = AsyncMock()
         redis_manager.client = mock_client
         redis_manager._message_handler = mock_handler
 
-        # Mock XREAD response
+        # One XREAD response, then cancel the loop on the next read
         message_id = "1234567890-0"
-        mock_client.xread.return_value = [
+        mock_client.xread.side_effect = [
             [
-                RedisManager.STREAM_KEY,
-                [(message_id, {"data": json_dumps(sample_message)})],
-            ]
+                [
+                    RedisManager.STREAM_KEY,
+                    [(message_id, {"data": sample_json})],
+                ]
+            ],
+            asyncio.CancelledError(),
         ]
 
-        # Run listen loop once and cancel
-        with contextlib.suppress(TimeoutError):
-            await asyncio.wait_for(redis_manager._listen_loop(), timeout=0.1)
+        with pytest.raises(asyncio.CancelledError):
+            await redis_manager._listen_loop()
 
-        mock_client.xread.assert_called()
-        mock_handler.assert_called_with(sample_message)
+        mock_client.xread.assert_awaited()
+        mock_handler.assert_awaited_once_with(sample_payload)
 
-    async def test_listen_loop_invalid_message(
-        self, redis_manager: RedisManager
+    async def test_listen_loop_skips_invalid_entry_and_advances(
+        self, redis_manager: RedisManager, sample_json: str, sample_payload: bytes
     ) -> None:
         mock_client = AsyncMock()
+        mock_handler = AsyncMock()
         redis_manager.client = mock_client
+        redis_manager._message_handler = mock_handler
 
-        # Mock XREAD response with invalid JSON
-        message_id = "1234567890-0"
-        mock_client.xread.return_value = [
+        # XREAD response with invalid JSON before a valid entry, then cancel
+        mock_client.xread.side_effect = [
             [
-                RedisManager.STREAM_KEY,
-                [(message_id, {"data": "invalid json"})],
-            ]
+                [
+                    RedisManager.STREAM_KEY,
+                    [
+                        ("1234567890-0", {"data": "invalid json"}),
+                        ("1234567890-1", {"data": sample_json}),
+                    ],
+                ]
+            ],
+            asyncio.CancelledError(),
         ]
 
-        # Should not crash on invalid message
-        with contextlib.suppress(TimeoutError):
-            await asyncio.wait_for(redis_manager._listen_loop(), timeout=0.1)
+        # The invalid entry must not stop the loop or the valid one after it
+        with pytest.raises(asyncio.CancelledError):
+            await redis_manager._listen_loop()
 
-        # Test should complete without raising
+        # The invalid entry is skipped, but the stream still advances past it
+        mock_handler.assert_awaited_once_with(sample_payload)
+        assert redis_manager._last_id == "1234567890-1"
 
     async def test_listen_loop_cancelled(self, redis_manager: RedisManager) -> None:
         mock_client = AsyncMock()
@@ -181,5 +308,37 @@ class TestRedisManager:
         with pytest.raises(asyncio.CancelledError):
             await redis_manager._listen_loop()
 
+    def test_extract_payloads_skips_own_origin(
+        self, redis_manager: RedisManager, sample_json: str
+    ) -> None:
+        payload = sample_json
+        response = [
+            ("1-0", {"data": payload, "origin": redis_manager.origin_id}),
+            ("2-0", {"data": payload, "origin": "another-worker"}),
+            ("3-0", {"data": payload}),
+        ]
+
+        payloads = list(
+            redis_manager.extract_payloads_from_response(
+                response, skip_origin=redis_manager.origin_id
+            )
+        )
+
+        assert payloads == [("2-0", payload.encode()), ("3-0", payload.encode())]
+
+    def test_extract_payloads_drops_invalid_entries(
+        self, redis_manager: RedisManager, sample_json: str
+    ) -> None:
+        response = [
+            ("1-0", {"data": "invalid json"}),
+            ("2-0", {"data": '{"text": "Missing fields"}'}),
+            ("3-0", {"data": sample_json}),
+        ]
+
+        payloads = list(redis_manager.extract_payloads_from_response(response))
+
+        # The valid entry is forwarded byte for byte, not re-serialized.
+        assert payloads == [("3-0", sample_json.encode())]
+
     def test_channel_constant(self) -> None:
         assert RedisManager.STREAM_KEY == "chat:messages"
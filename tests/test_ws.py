@@ -1,51 +1,180 @@
 import asyncio
+import socket
+from collections.abc import Callable
+from dataclasses import dataclass, field
 from typing import cast
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
-from aiohttp import WSCloseCode, WSMessage, WSMsgType
-
-from server.models import ChatMessage, json_dumps
-from server.ws import SEND_TIMEOUT, WS_CLOSE_TIMEOUT, PeerStatus, WSMessageRouter
+from aiohttp import WSCloseCode, WSMessage, WSMsgType, web
+
+from server.models import ChatMessage, dumps_bytes
+from server.ws import (
+    PEER_NOTSENT_LOWAT,
+    PEER_SNDBUF_SIZE,
+    PEER_WRITE_BUFFER_LIMIT,
+    WS_CLOSE_TIMEOUT,
+    PeerStatus,
+    WSMessageRouter,
+    build_text_frame,
+    tune_peer_socket,
+)
 
 # Test constants
-EXPECTED_CALL_COUNT = 2
-EXPECTED_CLIENT_COUNT = 2
-EXPECTED_SEND_TIMEOUT = 0.25
 EXPECTED_WS_CLOSE_TIMEOUT = 2.0
 
 
+def encode(message: ChatMessage) -> bytes:
+    return build_text_frame(message.to_json())
+
+
+@dataclass(eq=False)
+class StubTransport:
+    """A transport that records the frames written to it."""
+
+    closing: bool = False
+    aborted: bool = False
+    buffered: int = 0
+    write_error: Exception | None = None
+    written: list[bytes] = field(default_factory=list)
+
+    def write(self, data: bytes) -> None:
+        if self.write_error is not None:
+            raise self.write_error
+        self.written.append(data)
+
+    def is_closing(self) -> bool:
+        return self.closing
+
+    def get_write_buffer_size(self) -> int:
+        return self.buffered
+
+    def abort(self) -> None:
+        self.aborted = True
+        self.closing = True
+
+
+@dataclass(eq=False)
+class StubWriter:
+    transport: StubTransport = field(default_factory=StubTransport)
+
+
+@dataclass(eq=False)
+class StubWebSocket:
+    """A prepared peer with just the interface the router uses.
+
+    Frames written to it and close handshakes are recorded for assertions.
+    Much cheaper than AsyncMock.
+    """
+
+    closed: bool = False
+    # Mimics a peer that stopped reading, so the close never drains
+    stall_close: bool = False
+    close_calls: list[tuple[int, bytes]] = field(default_factory=list)
+    _writer: StubWriter = field(default_factory=StubWriter)
+
+    @property
+    def transport(self) -> StubTransport:
+        return self._writer.transport
+
+    async def close(self, *, code: int = WSCloseCode.OK, message: bytes = b"") -> bool:
+        self.close_calls.append((code, message))
+        if self.stall_close:
+            await asyncio.get_running_loop().create_future()
+        self.closed = True
+        return True
+
+
+def as_peer(stub: StubWebSocket) -> web.WebSocketResponse:
+    return cast(web.WebSocketResponse, stub)
+
+
 class TestPeerStatus:
     def test_enum_values(self) -> None:
         assert PeerStatus.OK
         assert PeerStatus.CLOSED
-        assert PeerStatus.TIMEOUT
+        assert PeerStatus.SLOW
         assert PeerStatus.INTERNAL_ERROR
 
 
+class TestBuildTextFrame:
+    def test_short_payload(self) -> None:
+        assert build_text_frame(b"hello") == b"\x81\x05hello"
+
+    def test_16_bit_length(self) -> None:
+        payload = b"a" * 300
+        assert build_text_frame(payload) == b"\x81\x7e\x01\x2c" + payload
+
+    def test_64_bit_length(self) -> None:
+        payload = b"a" * 70_000
+        frame = build_text_frame(payload)
+        assert frame[:10] == b"\x81\x7f" + (70_000).to_bytes(8, "big")
+        assert frame[10:] == payload
+
+
+class TestTunePeerSocket:
+    def test_sets_tcp_nodelay(self) -> None:
+        sock = MagicMock()
+        req = MagicMock()
+        req.transport.get_extra_info.return_value = sock
+
+        tune_peer_socket(req)
+
+        req.transport.get_extra_info.assert_called_once_with("socket")
+        sock.setsockopt.assert_any_call(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def test_sets_send_buffer_options(self) -> None:
+        sock = MagicMock()
+        req = MagicMock()
+        req.transport.get_extra_info.return_value = sock
+
+        tune_peer_socket(req)
+
+        sock.setsockopt.assert_any_call(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, PEER_SNDBUF_SIZE
+        )
+        if hasattr(socket, "TCP_NOTSENT_LOWAT"):
+            sock.setsockopt.assert_any_call(
+                socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, PEER_NOTSENT_LOWAT
+            )
+
+    def test_sets_write_buffer_limit(self) -> None:
+        req = MagicMock()
+
+        tune_peer_socket(req)
+
+        req.transport.set_write_buffer_limits.assert_called_once_with(
+            high=PEER_WRITE_BUFFER_LIMIT
+        )
+
+    def test_no_socket(self) -> None:
+        req = MagicMock()
+        req.transport.get_extra_info.return_value = None
+
+        # Should not raise without an underlying socket
+        tune_peer_socket(req)
+
+    def test_unsupported_option_ignored(self) -> None:
+        sock = MagicMock()
+        sock.setsockopt.side_effect = OSError("Operation not supported")
+        req = MagicMock()
+        req.transport.get_extra_info.return_value = sock
+
+        # Should not raise for sockets without TCP options
+        tune_peer_socket(req)
+
+
 class TestWSMessageRouter:
     @pytest.fixture
     def mock_redis_manager(self) -> MagicMock:
         mock = MagicMock()
-        mock.publish_message = MagicMock()
+        mock.publish_message = AsyncMock()
         return mock
 
     @pytest.fixture
     def ws_router(self, mock_redis_manager: MagicMock) -> WSMessageRouter:
         return WSMessageRouter(mock_redis_manager)
 
-    @pytest.fixture
-    def mock_websocket(self) -> AsyncMock:
-        ws = AsyncMock()
-        ws.closed = False
-        ws.send_str = AsyncMock()
-        ws.close = AsyncMock()
-        return ws
-
-    @pytest.fixture
-    def sample_message(self) -> ChatMessage:
-        return ChatMessage(text="Test message", type="message", ts=1234567890)
-
     def test_init(self, mock_redis_manager: MagicMock) -> None:
         router = WSMessageRouter(mock_redis_manager)
 
@@ -53,110 +182,221 @@ class TestWSMessageRouter:
         assert len(router.clients) == 0
         mock_redis_manager.set_message_handler.assert_called_once()
 
+    @pytest.mark.parametrize(
+        ("send_results", "expected_remaining"),
+        [
+            ([PeerStatus.OK, PeerStatus.OK], 2),
+            # One peer failing is dropped, the other stays
+            ([PeerStatus.OK, PeerStatus.SLOW], 1),
+        ],
+        ids=["all_ok", "one_failed"],
+    )
     async def test_broadcast_to_local_peers(
-        self, ws_router: WSMessageRouter, sample_message: ChatMessage
+        self,
+        ws_router: WSMessageRouter,
+        sample_message: ChatMessage,
+        send_results: list[PeerStatus],
+        expected_remaining: int,
+        monkeypatch: pytest.MonkeyPatch,
     ) -> None:
-        # Add mock clients
-        client1 = AsyncMock()
-        client1.closed = False
-        client2 = AsyncMock()
-        client2.closed = False
-
-        ws_router.clients.add(client1)
-        ws_router.clients.add(client2)
+        for _ in send_results:
+            ws_router._add_client(as_peer(StubWebSocket()))
 
-        with patch.object(ws_router, "_send_to_peer") as mock_send:
-            mock_send.return_value = PeerStatus.OK
+        results = iter(send_results)
+        calls: list[web.WebSocketResponse] = []
 
-            await ws_router._broadcast_to_local_peers(sample_message)
+        def write_frame_to_peer(
+            peer: web.WebSocketResponse, transport: asyncio.Transport, frame: bytes
+        ) -> PeerStatus:
+            calls.append(peer)
+            return next(results)
 
-            assert mock_send.call_count == EXPECTED_CALL_COUNT
-            # Both clients should still be in the set
-            assert len(ws_router.clients) == EXPECTED_CLIENT_COUNT
+        monkeypatch.setattr(ws_router, "_write_frame_to_peer", write_frame_to_peer)
 
-    async def test_broadcast_removes_failed_clients(
-        self, ws_router: WSMessageRouter, sample_message: ChatMessage
-    ) -> None:
-        # Add mock clients
-        client1 = AsyncMock()
-        client2 = AsyncMock()
+        ws_router._send_broadcast(encode(sample_message))
 
-        ws_router.clients.add(client1)
-        ws_router.clients.add(client2)
+        assert len(calls) == len(send_results)
+        assert len(ws_router.clients) == expected_remaining
 
-        with patch.object(ws_router, "_send_to_peer") as mock_send:
-            # Simulate one client failing
-            mock_send.side_effect = [PeerStatus.OK, PeerStatus.TIMEOUT]
+    def test_discard_client_swaps_last_peer_in(
+        self, ws_router: WSMessageRouter
+    ) -> None:
+        client1 = as_peer(StubWebSocket())
+        client2 = as_peer(StubWebSocket())
+        client3 = as_peer(StubWebSocket())
+        for client in (client1, client2, client3):
+            ws_router._add_client(client)
+
+        ws_router._discard_client(client1)
+
+        assert ws_router._peers == [client3, client2]
+        assert ws_router._peer_index == {client3: 0, client2: 1}
+        assert len(ws_router._transports) == len(ws_router._peers)
+
+        ws_router._discard_client(client1)  # Already removed, no-op
+        ws_router._discard_client(client2)
+
+        assert ws_router._peers == [client3]
+        assert set(ws_router.clients) == {client3}
+
+    @pytest.mark.parametrize(
+        ("closed", "transport", "expected_result"),
+        [
+            (False, StubTransport, PeerStatus.OK),
+            (True, StubTransport, PeerStatus.CLOSED),
+            (False, lambda: StubTransport(closing=True), PeerStatus.CLOSED),
+            (
+                False,
+                lambda: StubTransport(buffered=PEER_WRITE_BUFFER_LIMIT + 1),
+                PeerStatus.SLOW,
+            ),
+            (
+                False,
+                lambda: StubTransport(write_error=Exception("Test error")),
+                PeerStatus.INTERNAL_ERROR,
+            ),
+        ],
+        ids=["ok", "closed", "closing", "slow", "write_error"],
+    )
+    def test_write_frame_to_peer(
+        self,
+        ws_router: WSMessageRouter,
+        closed: bool,
+        transport: Callable[[], StubTransport],
+        expected_result: PeerStatus,
+    ) -> None:
+        peer = StubWebSocket(closed=closed, _writer=StubWriter(transport()))
 
-            await ws_router._broadcast_to_local_peers(sample_message)
+        result = ws_router._write_frame_to_peer(
+            as_peer(peer), cast(asyncio.Transport, peer.transport), b"test frame"
+        )
 
-            # Exactly one client should be removed (set iteration order is non-deterministic)
-            assert len(ws_router.clients) == 1
+        assert result == expected_result
+        expected_written = [b"test frame"] if result is PeerStatus.OK else []
+        assert peer.transport.written == expected_written
 
-    async def test_send_to_peer_success(
-        self, ws_router: WSMessageRouter, mock_websocket: AsyncMock
+    async def test_broadcast_writes_shared_frame(
+        self,
+        ws_router: WSMessageRouter,
+        sample_message: ChatMessage,
+        sample_payload: bytes,
     ) -> None:
-        result = await ws_router._send_to_peer(mock_websocket, "test payload")
+        peers = [StubWebSocket(), StubWebSocket()]
+        for peer in peers:
+            ws_router._add_client(as_peer(peer))
 
-        assert result == PeerStatus.OK
-        mock_websocket.send_str.assert_called_once_with("test payload")
+        ws_router._send_broadcast(encode(sample_message))
 
-    async def test_send_to_peer_closed_connection(
-        self, ws_router: WSMessageRouter
-    ) -> None:
-        closed_ws = AsyncMock()
-        closed_ws.closed = True
+        for peer in peers:
+            assert peer.transport.written == [build_text_frame(sample_payload)]
+            assert peer in ws_router.clients
 
-        result = await ws_router._send_to_peer(closed_ws, "test payload")
+    async def test_broadcast_without_peers_is_skipped(
+        self, ws_router: WSMessageRouter, sample_payload: bytes
+    ) -> None:
+        await ws_router._broadcast_to_local_peers(sample_payload)
 
-        assert result == PeerStatus.CLOSED
-        closed_ws.send_str.assert_not_called()
+        assert ws_router._pending_broadcasts == []
+        assert ws_router._flush_task is None
 
-    async def test_send_to_peer_timeout(self, ws_router: WSMessageRouter) -> None:
-        timeout_ws = AsyncMock()
-        timeout_ws.closed = False
-        timeout_ws.send_str.side_effect = TimeoutError()
-        timeout_ws.close = AsyncMock()
+    async def test_broadcast_sends_lone_message_as_object(
+        self, ws_router: WSMessageRouter, sample_payload: bytes
+    ) -> None:
+        peer = StubWebSocket()
+        ws_router._add_client(as_peer(peer))
 
-        result = await ws_router._send_to_peer(timeout_ws, "test payload")
+        await ws_router._broadcast_to_local_peers(sample_payload)
+        assert ws_router._flush_task is not None
+        await ws_router._flush_task
 
-        assert result == PeerStatus.TIMEOUT
-        timeout_ws.close.assert_called_once_with(
-            code=WSCloseCode.GOING_AWAY,
-            message=b"Send timeout",
-        )
+        assert peer.transport.written == [build_text_frame(sample_payload)]
 
-    async def test_send_to_peer_internal_error(
-        self, ws_router: WSMessageRouter
+    async def test_broadcast_coalesces_messages_into_array(
+        self,
+        ws_router: WSMessageRouter,
+        sample_message: ChatMessage,
+        sample_payload: bytes,
     ) -> None:
-        error_ws = AsyncMock()
-        error_ws.closed = False
-        error_ws.send_str.side_effect = Exception("Test error")
-        error_ws.close = AsyncMock()
-
-        result = await ws_router._send_to_peer(error_ws, "test payload")
-
-        assert result == PeerStatus.INTERNAL_ERROR
-        error_ws.close.assert_called_once_with(
-            code=WSCloseCode.INTERNAL_ERROR,
-            message=b"Unknown internal error",
-        )
+        other_message = ChatMessage(text="Second", type="message", ts=2)
+        peer = StubWebSocket()
+        ws_router._add_client(as_peer(peer))
+
+        await ws_router._broadcast_to_local_peers(sample_payload)
+        await ws_router._broadcast_to_local_peers(other_message.to_json())
+        assert ws_router._flush_task is not None
+        await ws_router._flush_task
+
+        assert peer.transport.written == [
+            build_text_frame(dumps_bytes([sample_message, other_message]))
+        ]
+        assert ws_router._pending_broadcasts == []
+        assert ws_router._flush_task is None
+
+    async def test_broadcast_drops_only_slow_peers(
+        self, ws_router: WSMessageRouter, sample_message: ChatMessage
+    ) -> None:
+        fast_ws = StubWebSocket()
+        slow_ws = StubWebSocket()
+        slow_ws.transport.buffered = PEER_WRITE_BUFFER_LIMIT + 1
+        ws_router._add_client(as_peer(fast_ws))
+        ws_router._add_client(as_peer(slow_ws))
+
+        ws_router._send_broadcast(encode(sample_message))
+        await ws_router._close_queue.join()
+
+        assert fast_ws in ws_router.clients
+        assert slow_ws not in ws_router.clients
+        assert fast_ws.transport.written == [encode(sample_message)]
+        assert slow_ws.transport.written == []
+        assert fast_ws.close_calls == []
+        assert slow_ws.close_calls == [(WSCloseCode.GOING_AWAY, b"Too slow to keep up")]
+
+    async def test_broadcast_closes_failed_peers(
+        self, ws_router: WSMessageRouter, sample_message: ChatMessage
+    ) -> None:
+        error_ws = StubWebSocket()
+        error_ws.transport.write_error = Exception("Test error")
+        ws_router._add_client(as_peer(error_ws))
+
+        ws_router._send_broadcast(encode(sample_message))
+        await ws_router._close_queue.join()
+
+        assert error_ws not in ws_router.clients
+        assert error_ws.close_calls == [
+            (WSCloseCode.INTERNAL_ERROR, b"Unknown internal error")
+        ]
+
+    async def test_stalled_close_is_aborted(
+        self,
+        ws_router: WSMessageRouter,
+        sample_message: ChatMessage,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        stalled_ws = StubWebSocket(stall_close=True)
+        stalled_ws.transport.buffered = PEER_WRITE_BUFFER_LIMIT + 1
+        error_ws = StubWebSocket()
+        error_ws.transport.write_error = Exception("Test error")
+        ws_router._add_client(as_peer(stalled_ws))
+        ws_router._add_client(as_peer(error_ws))
+        monkeypatch.setattr("server.ws.WS_CLOSE_TIMEOUT", 0.0)
+
+        ws_router._send_broadcast(encode(sample_message))
+        # Must not hang on the stalled peer
+        await ws_router._close_queue.join()
+
+        assert stalled_ws.transport.aborted
+        assert error_ws.closed
+        assert not error_ws.transport.aborted
 
     async def test_handle_text_valid_message(
-        self, ws_router: WSMessageRouter, sample_message: ChatMessage
+        self, ws_router: WSMessageRouter, sample_json: str, sample_payload: bytes
     ) -> None:
-        message = WSMessage(
-            type=WSMsgType.TEXT, data=json_dumps(sample_message), extra=None
-        )
+        message = WSMessage(type=WSMsgType.TEXT, data=sample_json, extra=None)
 
         await ws_router._handle_text(message)
 
-        mock_publish = cast(MagicMock, ws_router.redis.publish_message)
-        mock_publish.assert_called_once()
-        published_msg = mock_publish.call_args[0][0]
-        assert published_msg.text == sample_message.text
-        assert published_msg.type == sample_message.type
-        assert published_msg.ts == sample_message.ts
+        mock_publish = cast(AsyncMock, ws_router.redis.publish_message)
+        mock_publish.assert_awaited_once_with(sample_payload)
 
     async def test_handle_text_invalid_json(self, ws_router: WSMessageRouter) -> None:
         message = WSMessage(type=WSMsgType.TEXT, data="invalid json", extra=None)
@@ -180,6 +420,32 @@ class TestWSMessageRouter:
         mock_publish = cast(MagicMock, ws_router.redis.publish_message)
         mock_publish.assert_not_called()
 
+    async def test_handle_text_extra_fields(self, ws_router: WSMessageRouter) -> None:
+        message = WSMessage(
+            type=WSMsgType.TEXT,
+            data='{"text": "Hi", "type": "message", "ts": 1, "extra": "field"}',
+            extra=None,
+        )
+
+        # Should not raise exception
+        await ws_router._handle_text(message)
+
+        # Unknown fields are rejected rather than silently stripped
+        mock_publish = cast(MagicMock, ws_router.redis.publish_message)
+        mock_publish.assert_not_called()
+
+    async def test_handle_text_not_an_object(self, ws_router: WSMessageRouter) -> None:
+        message = WSMessage(
+            type=WSMsgType.TEXT, data='["not", "a", "dict"]', extra=None
+        )
+
+        # Should not raise exception
+        await ws_router._handle_text(message)
+
+        # Should not publish anything
+        mock_publish = cast(MagicMock, ws_router.redis.publish_message)
+        mock_publish.assert_not_called()
+
     async def test_close_all_connections_empty(
         self, ws_router: WSMessageRouter
     ) -> None:
@@ -191,47 +457,48 @@ class TestWSMessageRouter:
     async def test_close_all_connections_with_clients(
         self, ws_router: WSMessageRouter
     ) -> None:
-        # Add mock clients
-        client1 = AsyncMock()
-        client1.closed = False
-        client2 = AsyncMock()
-        client2.closed = True  # Already closed
+        client1 = StubWebSocket()
+        client2 = StubWebSocket(closed=True)  # Already closed
 
-        ws_router.clients.add(client1)
-        ws_router.clients.add(client2)
+        ws_router._add_client(as_peer(client1))
+        ws_router._add_client(as_peer(client2))
 
         await ws_router.close_all_connections()
 
         # Only open client should be closed
-        client1.close.assert_called_once_with(
-            code=WSCloseCode.GOING_AWAY, message=b"Server shutting down"
-        )
-        client2.close.assert_not_called()
+        assert client1.close_calls == [
+            (WSCloseCode.GOING_AWAY, b"Server shutting down")
+        ]
+        assert client2.close_calls == []
 
         # All clients should be cleared
         assert len(ws_router.clients) == 0
 
     async def test_close_all_connections_timeout(
-        self, ws_router: WSMessageRouter
+        self, ws_router: WSMessageRouter, monkeypatch: pytest.MonkeyPatch
     ) -> None:
-        # Add mock client that times out on close
+        async def never_close(**_: object) -> None:
+            await asyncio.get_running_loop().create_future()
+
+        # Add mock client whose close never completes
         slow_client = AsyncMock()
         slow_client.closed = False
-        slow_client.close.side_effect = asyncio.sleep(10)  # Simulate slow close
+        slow_client.close.side_effect = never_close
+        monkeypatch.setattr("server.ws.WS_CLOSE_TIMEOUT", 0.0)
 
-        ws_router.clients.add(slow_client)
+        ws_router._add_client(slow_client)
 
         # Should complete despite timeout
         await ws_router.close_all_connections()
 
         assert len(ws_router.clients) == 0
 
-    @patch("server.ws.web.WebSocketResponse")
     async def test_initialize_ws_context_manager(
-        self, mock_ws_class: MagicMock, ws_router: WSMessageRouter
+        self, ws_router: WSMessageRouter, monkeypatch: pytest.MonkeyPatch
     ) -> None:
         mock_ws = AsyncMock()
-        mock_ws_class.return_value = mock_ws
+        mock_ws.close_code = None
+        monkeypatch.setattr("server.ws.web.WebSocketResponse", lambda **_: mock_ws)
         mock_req = MagicMock()
 
         async with ws_router._initialize_ws(mock_req) as ws:
@@ -244,5 +511,4 @@ class TestWSMessageRouter:
         mock_ws.close.assert_called_once()
 
     def test_constants(self) -> None:
-        assert SEND_TIMEOUT == EXPECTED_SEND_TIMEOUT
         assert WS_CLOSE_TIMEOUT == EXPECTED_WS_CLOSE_TIMEOUT